@@ -1,9 +1,21 @@
 import os
-from fastapi import FastAPI, HTTPException, Depends, Body
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import math
+import tempfile
+import threading
+import time
+from fastapi import FastAPI, HTTPException, Depends, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
+import pymongo
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from pydantic import BaseModel
+from abc import ABC, abstractmethod
 from typing import List, Dict, Optional
 import uuid
 from datetime import datetime
@@ -40,6 +52,54 @@ colors_collection = db.colors
 orders_collection = db.orders
 fabric_types_collection = db.fabric_types
 
+logger = logging.getLogger("skydiving_suits")
+
+# Catalog snapshot (colors + fabric types) kept on disk so reads survive a slow or down MongoDB
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', '/tmp/catalog_snapshot.json')
+CATALOG_DB_TIMEOUT = float(os.environ.get('CATALOG_DB_TIMEOUT_MS', '300')) / 1000
+CATALOG_REFRESH_SECONDS = float(os.environ.get('CATALOG_REFRESH_SECONDS', '60'))
+CATALOG_RETRY_SECONDS = float(os.environ.get('CATALOG_RETRY_SECONDS', '5'))
+
+# "version" is a hash of the catalog contents, so workers sharing the snapshot file agree on it
+catalog_cache = {"version": None, "updated_at": None, "colors": [], "fabric_types": []}
+catalog_lock = threading.Lock()
+snapshot_write_lock = threading.Lock()
+# Monotonic time of the last successful MongoDB load in this process
+catalog_refreshed_at = None
+# Once a read fails, serve from the cache until the background loop reaches MongoDB again
+catalog_db_available = True
+
+ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', '80418914')
+
+# Admission control for expensive routes: max concurrent requests per route class and
+# per client, and a token bucket (requests per minute + burst) per route class and client
+def load_admission_limits(prefix: str, max_concurrent: int, max_concurrent_per_client: int,
+                          rate_per_minute: float, burst: int) -> dict:
+    limits = {
+        "max_concurrent": int(os.environ.get(f'{prefix}_MAX_CONCURRENT', max_concurrent)),
+        "max_concurrent_per_client": int(os.environ.get(f'{prefix}_MAX_CONCURRENT_PER_CLIENT', max_concurrent_per_client)),
+        "rate_per_minute": float(os.environ.get(f'{prefix}_RATE_PER_MINUTE', rate_per_minute)),
+        "burst": int(os.environ.get(f'{prefix}_BURST', burst)),
+    }
+    if (limits["max_concurrent"] < 1 or limits["max_concurrent_per_client"] < 1
+            or limits["rate_per_minute"] <= 0 or limits["burst"] < 1):
+        raise ValueError(f"Invalid {prefix} admission limits: {limits}")
+    return limits
+
+ADMISSION_LIMITS = {
+    "orders": load_admission_limits("ORDERS", max_concurrent=4, max_concurrent_per_client=1, rate_per_minute=10, burst=3),
+    "admin": load_admission_limits("ADMIN", max_concurrent=2, max_concurrent_per_client=1, rate_per_minute=20, burst=20),
+}
+
+# API keys that get their own rate bucket on non-admin routes; other callers are keyed by IP
+ADMISSION_API_KEYS = {key for key in os.environ.get('ADMISSION_API_KEYS', '').split(',') if key}
+
+# Proxies (IPs or CIDRs) whose X-Forwarded-For header is trusted, e.g. the ingress in front of uvicorn
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip())
+    for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()
+]
+
 # Pydantic models
 class Color(BaseModel):
     id: str
@@ -77,9 +137,266 @@ class AdminColorRequest(BaseModel):
     color: Optional[Color] = None
     color_id: Optional[str] = None
 
-# Initialize default data
+# Admission control
+class AdmissionStore(ABC):
+    """Counters behind admission control; subclass to share them across workers"""
+    
+    @abstractmethod
+    async def acquire(self, key: str, limit: int) -> bool:
+        """Take a concurrency slot for key, returning False if all limit slots are in use"""
+    
+    @abstractmethod
+    async def release(self, key: str):
+        """Give back a slot taken with acquire"""
+    
+    @abstractmethod
+    async def take_token(self, key: str, rate_per_second: float, burst: int) -> float:
+        """Take one token from key's bucket, returning 0 or the seconds until one is available"""
+    
+    @abstractmethod
+    async def return_token(self, key: str, burst: int):
+        """Give back a token taken with take_token for a request that was not admitted"""
+
+class InMemoryAdmissionStore(AdmissionStore):
+    """Per-process admission counters"""
+    
+    SWEEP_SECONDS = 60
+    
+    def __init__(self):
+        self.in_flight = {}
+        self.buckets = {}
+        self.last_sweep = time.monotonic()
+    
+    async def acquire(self, key: str, limit: int) -> bool:
+        if self.in_flight.get(key, 0) >= limit:
+            return False
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        return True
+    
+    async def release(self, key: str):
+        remaining = self.in_flight.get(key, 0) - 1
+        if remaining > 0:
+            self.in_flight[key] = remaining
+        else:
+            self.in_flight.pop(key, None)
+    
+    async def take_token(self, key: str, rate_per_second: float, burst: int) -> float:
+        now = time.monotonic()
+        self.evict_idle_buckets(now)
+        
+        tokens, last, _ = self.buckets.get(key, (burst, now, 0))
+        tokens = min(burst, tokens + (now - last) * rate_per_second)
+        # A bucket untouched for burst / rate seconds is full again and can be dropped
+        idle_after = burst / rate_per_second
+        if tokens < 1:
+            self.buckets[key] = (tokens, now, idle_after)
+            return (1 - tokens) / rate_per_second
+        self.buckets[key] = (tokens - 1, now, idle_after)
+        return 0
+    
+    async def return_token(self, key: str, burst: int):
+        if key in self.buckets:
+            tokens, last, idle_after = self.buckets[key]
+            self.buckets[key] = (min(burst, tokens + 1), last, idle_after)
+    
+    def evict_idle_buckets(self, now: float):
+        if now - self.last_sweep < self.SWEEP_SECONDS:
+            return
+        self.last_sweep = now
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if now - bucket[1] <= bucket[2]
+        }
+
+admission_store: AdmissionStore = InMemoryAdmissionStore()
+
+def client_ip(request: Request) -> str:
+    """Caller IP, taken from X-Forwarded-For only when the direct peer is a trusted proxy"""
+    host = request.client.host if request.client else "unknown"
+    
+    def is_trusted(address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in proxy for proxy in TRUSTED_PROXIES)
+    
+    if not is_trusted(host):
+        return host
+    
+    # Walk the chain from the nearest hop and stop at the first address we don't trust
+    forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        if not is_trusted(hop):
+            return hop
+    return host
+
+def client_key(request: Request, route_class: str) -> str:
+    """Identify the caller by a known API key, otherwise by IP; admin is always keyed by IP"""
+    api_key = request.headers.get("x-api-key")
+    if route_class != "admin" and api_key in ADMISSION_API_KEYS:
+        return f"key:{api_key}"
+    return f"ip:{client_ip(request)}"
+
+def too_many_requests(retry_after: float, detail: str):
+    raise HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+def admission(route_class: str):
+    """Dependency that rejects requests over the route class limits with a 429"""
+    limits = ADMISSION_LIMITS[route_class]
+    
+    async def check(request: Request):
+        client = f"{route_class}:{client_key(request, route_class)}"
+        # Rate-limited callers are turned away before they can occupy any slot
+        retry_after = await admission_store.take_token(client, limits["rate_per_minute"] / 60, limits["burst"])
+        if retry_after:
+            too_many_requests(retry_after, "Rate limit exceeded")
+        
+        if not await admission_store.acquire(client, limits["max_concurrent_per_client"]):
+            await admission_store.return_token(client, limits["burst"])
+            too_many_requests(1, "Too many requests in progress, try again shortly")
+        try:
+            if not await admission_store.acquire(route_class, limits["max_concurrent"]):
+                await admission_store.return_token(client, limits["burst"])
+                too_many_requests(1, "Server busy, try again shortly")
+            try:
+                yield
+            finally:
+                await admission_store.release(route_class)
+        finally:
+            await admission_store.release(client)
+    
+    return check
+
+# Catalog snapshot helpers
+def catalog_version(colors: List[dict], fabric_types: List[dict]) -> str:
+    content = json.dumps({"colors": colors, "fabric_types": fabric_types}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:12]
+
+def load_catalog_snapshot():
+    """Load the on-disk catalog snapshot into the in-memory cache"""
+    try:
+        with open(CATALOG_SNAPSHOT_PATH) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Catalog snapshot not loaded: %s", e)
+        return False
+    
+    with catalog_lock:
+        catalog_cache.update({
+            "version": snapshot.get("version"),
+            "updated_at": snapshot.get("updated_at"),
+            "colors": snapshot.get("colors", []),
+            "fabric_types": snapshot.get("fabric_types", []),
+        })
+    return True
+
+def write_catalog_snapshot(colors: List[dict], fabric_types: List[dict]):
+    """Store a new catalog version in memory and on disk if anything changed"""
+    version = catalog_version(colors, fabric_types)
+    with catalog_lock:
+        if version == catalog_cache["version"]:
+            return
+        catalog_cache.update({
+            "version": version,
+            "updated_at": datetime.now().isoformat(),
+            "colors": colors,
+            "fabric_types": fabric_types,
+        })
+    
+    # Serialize outside catalog_lock so readers on the event loop never wait on disk
+    with snapshot_write_lock:
+        snapshot = current_catalog()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(CATALOG_SNAPSHOT_PATH) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, CATALOG_SNAPSHOT_PATH)
+        except OSError as e:
+            logger.warning("Catalog snapshot not written: %s", e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def current_catalog() -> dict:
+    with catalog_lock:
+        return dict(catalog_cache)
+
+def fetch_catalog() -> Dict[str, List[dict]]:
+    """Read the full catalog from MongoDB within the latency budget"""
+    with pymongo.timeout(CATALOG_DB_TIMEOUT):
+        return {
+            "colors": list(colors_collection.find({}, {"_id": 0})),
+            "fabric_types": list(fabric_types_collection.find({}, {"_id": 0})),
+        }
+
+def refresh_catalog():
+    """Reload the catalog from MongoDB and update the snapshot"""
+    global catalog_db_available, catalog_refreshed_at
+    catalog = fetch_catalog()
+    write_catalog_snapshot(catalog["colors"], catalog["fabric_types"])
+    catalog_refreshed_at = time.monotonic()
+    catalog_db_available = True
+
+def catalog_is_stale() -> bool:
+    # The background loop refreshes every CATALOG_REFRESH_SECONDS; allow one missed round
+    return catalog_refreshed_at is None or time.monotonic() - catalog_refreshed_at > 2 * CATALOG_REFRESH_SECONDS
+
+async def read_catalog() -> dict:
+    """Return the cached catalog, going to MongoDB only when the cache is empty or stale"""
+    global catalog_db_available
+    if catalog_cache["version"] is not None and (not catalog_db_available or not catalog_is_stale()):
+        return current_catalog()
+    
+    try:
+        await asyncio.wait_for(asyncio.to_thread(refresh_catalog), timeout=CATALOG_DB_TIMEOUT)
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        reason = f"timed out after {CATALOG_DB_TIMEOUT * 1000:g}ms" if isinstance(e, asyncio.TimeoutError) else repr(e)
+        if catalog_cache["version"] is None:
+            logger.warning("Catalog unavailable, no snapshot to serve: %s", reason)
+            raise HTTPException(status_code=503, detail="Catalog temporarily unavailable")
+        catalog_db_available = False
+        logger.warning("Serving catalog from snapshot %s: %s", catalog_cache["version"], reason)
+    return current_catalog()
+
+async def try_refresh_catalog():
+    global catalog_db_available
+    try:
+        await asyncio.to_thread(refresh_catalog)
+    except PyMongoError as e:
+        catalog_db_available = False
+        logger.warning("Catalog refresh failed: %s", e)
+
+async def catalog_refresh_loop():
+    """Seed default data, then keep the catalog snapshot fresh in the background"""
+    seeded = False
+    while True:
+        try:
+            if not seeded:
+                await asyncio.to_thread(seed_default_data)
+                seeded = True
+            await asyncio.to_thread(refresh_catalog)
+            delay = CATALOG_REFRESH_SECONDS
+        except Exception:
+            logger.exception("Catalog refresh failed, retrying in %ss", CATALOG_RETRY_SECONDS)
+            delay = CATALOG_RETRY_SECONDS
+        await asyncio.sleep(delay)
+
 @app.on_event("startup")
 async def startup_event():
+    # Serve the last known catalog right away, even before MongoDB answers
+    load_catalog_snapshot()
+    app.state.catalog_refresh_task = asyncio.create_task(catalog_refresh_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.catalog_refresh_task.cancel()
+
+# Initialize default data
+def seed_default_data():
     # Initialize fabric types
     fabric_types = [
         {"id": "tela1", "name": "Tela #1", "pattern_type": "diagonal"},
@@ -133,23 +450,24 @@ async def health_check():
 
 @app.get("/api/fabric-types")
 async def get_fabric_types():
-    fabric_types = list(fabric_types_collection.find({}, {"_id": 0}))
-    return {"fabric_types": fabric_types}
+    catalog = await read_catalog()
+    return {"fabric_types": catalog["fabric_types"]}
 
 @app.get("/api/colors")
 async def get_colors():
-    colors = list(colors_collection.find({}, {"_id": 0}))
-    return {"colors": colors}
+    catalog = await read_catalog()
+    return {"colors": catalog["colors"]}
 
 @app.get("/api/colors/{fabric_type}")
 async def get_colors_by_fabric_type(fabric_type: str):
-    colors = list(colors_collection.find({"fabric_type": fabric_type}, {"_id": 0}))
+    catalog = await read_catalog()
+    colors = [color for color in catalog["colors"] if color.get("fabric_type") == fabric_type]
     return {"colors": colors}
 
-@app.post("/api/admin/colors")
+@app.post("/api/admin/colors", dependencies=[Depends(admission("admin"))])
 async def manage_colors(request: AdminColorRequest):
     # Verify admin password
-    if request.password != "80418914":
+    if not hmac.compare_digest(request.password.encode(), ADMIN_PASSWORD.encode()):
         raise HTTPException(status_code=403, detail="Invalid admin password")
     
     if request.action == "add":
@@ -161,6 +479,7 @@ async def manage_colors(request: AdminColorRequest):
             raise HTTPException(status_code=400, detail="Color with this ID already exists")
         
         colors_collection.insert_one(request.color.dict())
+        await try_refresh_catalog()
         return {"message": "Color added successfully"}
     
     elif request.action == "remove":
@@ -171,6 +490,7 @@ async def manage_colors(request: AdminColorRequest):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Color not found")
         
+        await try_refresh_catalog()
         return {"message": "Color removed successfully"}
     
     elif request.action == "update":
@@ -181,6 +501,7 @@ async def manage_colors(request: AdminColorRequest):
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Color not found")
         
+        await try_refresh_catalog()
         return {"message": "Color updated successfully"}
     
     else:
@@ -260,7 +581,7 @@ def generate_pdf(order_data: dict) -> str:
     
     return filepath
 
-@app.post("/api/orders")
+@app.post("/api/orders", dependencies=[Depends(admission("orders"))])
 async def create_order(order_data: dict = Body(...)):
     # Generate unique order ID
     order_id = str(uuid.uuid4())
@@ -276,7 +597,8 @@ async def create_order(order_data: dict = Body(...)):
     
     # Generate PDF
     try:
-        pdf_path = generate_pdf(order)
+        # Render off the event loop so catalog reads stay fast while PDFs are built
+        pdf_path = await asyncio.to_thread(generate_pdf, order)
         order["pdf_path"] = pdf_path
         
         # Save order to database
@@ -3,7 +3,10 @@ import requests
 import json
 import time
 import os
+import sys
 import uuid
+import asyncio
+import tempfile
 from datetime import datetime
 
 # Get the backend URL from the frontend .env file
@@ -355,6 +358,378 @@ def test_download_pdf():
     
     return True
 
+def load_server():
+    """Import backend/server.py in-process for tests that need to fake MongoDB"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    import server
+    return server
+
+def reset_catalog(server, snapshot_path):
+    server.CATALOG_SNAPSHOT_PATH = snapshot_path
+    server.catalog_cache.update({"version": None, "updated_at": None, "colors": [], "fabric_types": []})
+    server.catalog_refreshed_at = None
+    server.catalog_db_available = True
+
+SAMPLE_COLORS = [{"id": "t4_yellow", "name": "Yellow", "hex_value": "#FFFF00", "fabric_type": "tela4"}]
+SAMPLE_FABRIC_TYPES = [{"id": "tela4", "name": "Tela #4", "pattern_type": "horizontal"}]
+
+@run_test("Catalog Snapshot Write and Load Round-Trip")
+def test_catalog_snapshot_round_trip():
+    """Test that a written catalog snapshot is loaded back unchanged"""
+    server = load_server()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        colors = [{"id": "t1_red", "name": "Red", "hex_value": "#FF0000", "fabric_type": "tela1"}]
+        fabric_types = [{"id": "tela1", "name": "Tela #1", "pattern_type": "diagonal"}]
+        
+        version = server.catalog_version(colors, fabric_types)
+        server.write_catalog_snapshot(colors, fabric_types)
+        server.write_catalog_snapshot(colors, fabric_types)
+        assert server.catalog_cache["version"] == version, f"Expected version {version}, got {server.catalog_cache['version']}"
+        assert os.listdir(tmp_dir) == ["catalog.json"], f"Unexpected files left in snapshot dir: {os.listdir(tmp_dir)}"
+        
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        assert server.load_catalog_snapshot(), "Snapshot should load"
+        assert server.catalog_cache["version"] == version, f"Expected version {version}, got {server.catalog_cache['version']}"
+        assert server.catalog_cache["colors"] == colors, "Loaded colors differ from written colors"
+        assert server.catalog_cache["fabric_types"] == fabric_types, "Loaded fabric types differ from written fabric types"
+    
+    return True
+
+@run_test("Catalog Fallback When MongoDB Is Down")
+def test_catalog_fallback_when_mongo_down():
+    """Test that catalog reads serve the snapshot and stop hitting MongoDB after a failure"""
+    server = load_server()
+    original_fetch = server.fetch_catalog
+    calls = []
+    
+    def failing_fetch():
+        calls.append(1)
+        raise server.PyMongoError("connection refused")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.write_catalog_snapshot(SAMPLE_COLORS, SAMPLE_FABRIC_TYPES)
+        server.fetch_catalog = failing_fetch
+        try:
+            data = asyncio.run(server.get_colors_by_fabric_type("tela4"))
+            assert [c["id"] for c in data["colors"]] == ["t4_yellow"], f"Expected snapshot colors, got {data}"
+            
+            data = asyncio.run(server.get_fabric_types())
+            assert [f["id"] for f in data["fabric_types"]] == ["tela4"], f"Expected snapshot fabric types, got {data}"
+            assert len(calls) == 1, f"Expected MongoDB to be tried once, got {len(calls)} calls"
+        finally:
+            server.fetch_catalog = original_fetch
+    
+    return True
+
+@run_test("Catalog Returns 503 Without Snapshot When MongoDB Is Down")
+def test_catalog_unavailable_without_snapshot():
+    """Test that an empty cache gives a 503 instead of an empty catalog"""
+    server = load_server()
+    original_fetch = server.fetch_catalog
+    
+    def failing_fetch():
+        raise server.PyMongoError("connection refused")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.fetch_catalog = failing_fetch
+        try:
+            try:
+                asyncio.run(server.get_colors())
+                assert False, "Expected a 503 with no snapshot"
+            except server.HTTPException as e:
+                assert e.status_code == 503, f"Expected status code 503, got {e.status_code}"
+            assert server.catalog_db_available, "Breaker should stay closed with no snapshot to serve"
+        finally:
+            server.fetch_catalog = original_fetch
+    
+    return True
+
+@run_test("Catalog Served Within Latency Budget When MongoDB Is Slow")
+def test_catalog_slow_mongo():
+    """Test that a slow fetch falls back to the snapshot after about CATALOG_DB_TIMEOUT"""
+    server = load_server()
+    original_fetch = server.fetch_catalog
+    original_timeout = server.CATALOG_DB_TIMEOUT
+    
+    def slow_fetch():
+        time.sleep(1)
+        return {"colors": [], "fabric_types": []}
+    
+    async def timed_read():
+        start = time.monotonic()
+        data = await server.get_colors()
+        return data, time.monotonic() - start
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.write_catalog_snapshot(SAMPLE_COLORS, SAMPLE_FABRIC_TYPES)
+        server.CATALOG_DB_TIMEOUT = 0.1
+        server.fetch_catalog = slow_fetch
+        try:
+            data, elapsed = asyncio.run(timed_read())
+            assert data["colors"] == SAMPLE_COLORS, f"Expected snapshot colors, got {data}"
+            assert elapsed < 0.5, f"Expected fallback within the budget, took {elapsed:.2f}s"
+        finally:
+            server.fetch_catalog = original_fetch
+            server.CATALOG_DB_TIMEOUT = original_timeout
+    
+    return True
+
+@run_test("Catalog Served From Cache While Fresh")
+def test_catalog_fresh_cache():
+    """Test that reads do not go to MongoDB after a recent refresh"""
+    server = load_server()
+    original_fetch = server.fetch_catalog
+    calls = []
+    
+    def counting_fetch():
+        calls.append(1)
+        return {"colors": SAMPLE_COLORS, "fabric_types": SAMPLE_FABRIC_TYPES}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.fetch_catalog = counting_fetch
+        try:
+            server.refresh_catalog()
+            for _ in range(3):
+                data = asyncio.run(server.get_colors())
+                assert data["colors"] == SAMPLE_COLORS, f"Expected cached colors, got {data}"
+            assert len(calls) == 1, f"Expected only the initial refresh to hit MongoDB, got {len(calls)} calls"
+        finally:
+            server.fetch_catalog = original_fetch
+    
+    return True
+
+@run_test("Catalog Snapshot Loaded At Startup and Seeding Retried")
+def test_catalog_startup_and_seed_retry():
+    """Test that startup serves the snapshot immediately and the loop retries seeding"""
+    server = load_server()
+    original_fetch = server.fetch_catalog
+    original_seed = server.seed_default_data
+    original_retry = server.CATALOG_RETRY_SECONDS
+    seed_attempts = []
+    
+    def flaky_seed():
+        seed_attempts.append(1)
+        if len(seed_attempts) == 1:
+            raise server.PyMongoError("connection refused")
+    
+    async def start_and_stop():
+        await server.startup_event()
+        loaded = server.current_catalog()
+        await asyncio.sleep(0.2)
+        await server.shutdown_event()
+        return loaded
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.write_catalog_snapshot(SAMPLE_COLORS, SAMPLE_FABRIC_TYPES)
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.CATALOG_RETRY_SECONDS = 0.01
+        server.seed_default_data = flaky_seed
+        server.fetch_catalog = lambda: {"colors": SAMPLE_COLORS, "fabric_types": SAMPLE_FABRIC_TYPES}
+        try:
+            loaded = asyncio.run(start_and_stop())
+            assert loaded["colors"] == SAMPLE_COLORS, f"Expected snapshot at startup, got {loaded}"
+            assert len(seed_attempts) == 2, f"Expected seeding to be retried once, got {len(seed_attempts)} attempts"
+            assert server.catalog_refreshed_at is not None, "Catalog should be refreshed after seeding succeeds"
+        finally:
+            server.fetch_catalog = original_fetch
+            server.seed_default_data = original_seed
+            server.CATALOG_RETRY_SECONDS = original_retry
+    
+    return True
+
+@run_test("Catalog Refresh After Admin Color Change")
+def test_catalog_refresh_after_admin_change():
+    """Test that manage_colors refreshes the catalog snapshot"""
+    server = load_server()
+    original_fetch = server.fetch_catalog
+    original_collection = server.colors_collection
+    stored_colors = []
+    
+    class FakeColors:
+        def find_one(self, query):
+            return next((c for c in stored_colors if c["id"] == query["id"]), None)
+        
+        def insert_one(self, color):
+            stored_colors.append(color)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reset_catalog(server, os.path.join(tmp_dir, "catalog.json"))
+        server.colors_collection = FakeColors()
+        server.fetch_catalog = lambda: {"colors": list(stored_colors), "fabric_types": []}
+        try:
+            color = server.Color(id="t1_pink", name="Pink", hex_value="#FFC0CB", fabric_type="tela1")
+            request = server.AdminColorRequest(password=ADMIN_PASSWORD, action="add", color=color)
+            asyncio.run(server.manage_colors(request))
+            
+            assert [c["id"] for c in server.catalog_cache["colors"]] == ["t1_pink"], "Cache not refreshed after add"
+            with open(server.CATALOG_SNAPSHOT_PATH) as f:
+                snapshot = json.load(f)
+            assert [c["id"] for c in snapshot["colors"]] == ["t1_pink"], "Snapshot not refreshed after add"
+        finally:
+            server.fetch_catalog = original_fetch
+            server.colors_collection = original_collection
+    
+    return True
+
+def admin_test_client(server, limits, peer=None):
+    """TestClient with fresh admission counters and the given admin limits, optionally from a peer IP"""
+    from fastapi.testclient import TestClient
+    server.admission_store = server.InMemoryAdmissionStore()
+    server.ADMISSION_LIMITS["admin"].update(limits)
+    if peer is None:
+        return TestClient(server.app)
+    
+    async def app_from_peer(scope, receive, send):
+        if scope["type"] == "http":
+            scope = dict(scope, client=(peer, 50000))
+        await server.app(scope, receive, send)
+    
+    return TestClient(app_from_peer)
+
+@run_test("Admission Control - Rate Limit Returns 429 With Retry-After")
+def test_admission_rate_limit():
+    """Test that admin calls over the rate get a 429, even with a fresh X-API-Key each time"""
+    server = load_server()
+    original_limits = dict(server.ADMISSION_LIMITS["admin"])
+    try:
+        client = admin_test_client(server, {"max_concurrent": 2, "rate_per_minute": 6, "burst": 2})
+        payload = {"password": "wrong_password", "action": "remove", "color_id": "t1_red"}
+        
+        statuses = []
+        for _ in range(3):
+            response = client.post("/api/admin/colors", json=payload, headers={"X-API-Key": uuid.uuid4().hex})
+            statuses.append(response.status_code)
+        assert statuses == [403, 403, 429], f"Expected [403, 403, 429], got {statuses}"
+        assert response.headers.get("Retry-After") == "10", f"Expected Retry-After '10', got {response.headers.get('Retry-After')}"
+        assert response.json()["detail"] == "Rate limit exceeded", f"Unexpected detail '{response.json()['detail']}'"
+    finally:
+        server.ADMISSION_LIMITS["admin"].update(original_limits)
+    
+    return True
+
+@run_test("Admission Control - Busy Route Returns 429 Without Using Rate Budget")
+def test_admission_concurrency_limit():
+    """Test that a saturated route class gets a fast 429 and keeps the client's tokens"""
+    server = load_server()
+    original_limits = dict(server.ADMISSION_LIMITS["admin"])
+    try:
+        client = admin_test_client(server, {"max_concurrent": 1, "rate_per_minute": 6, "burst": 1})
+        payload = {"password": "wrong_password", "action": "remove", "color_id": "t1_red"}
+        
+        asyncio.run(server.admission_store.acquire("admin", 1))
+        response = client.post("/api/admin/colors", json=payload)
+        assert response.status_code == 429, f"Expected status code 429, got {response.status_code}"
+        assert response.json()["detail"] == "Server busy, try again shortly", f"Unexpected detail '{response.json()['detail']}'"
+        assert "Retry-After" in response.headers, "Response missing 'Retry-After' header"
+        
+        asyncio.run(server.admission_store.release("admin"))
+        response = client.post("/api/admin/colors", json=payload)
+        assert response.status_code == 403, f"Expected status code 403 once the route is free, got {response.status_code}"
+    finally:
+        server.ADMISSION_LIMITS["admin"].update(original_limits)
+    
+    return True
+
+@run_test("Admission Control - Per-Client In-Flight Cap")
+def test_admission_per_client_limit():
+    """Test that one client cannot hold more than its share of a route's slots"""
+    server = load_server()
+    original_limits = dict(server.ADMISSION_LIMITS["admin"])
+    try:
+        limits = {"max_concurrent": 4, "max_concurrent_per_client": 1, "rate_per_minute": 6, "burst": 1}
+        other_client = admin_test_client(server, limits, peer="198.51.100.2")
+        busy_client = admin_test_client(server, limits, peer="198.51.100.1")
+        payload = {"password": "wrong_password", "action": "remove", "color_id": "t1_red"}
+        
+        asyncio.run(server.admission_store.acquire("admin:ip:198.51.100.1", 1))
+        response = busy_client.post("/api/admin/colors", json=payload)
+        assert response.status_code == 429, f"Expected status code 429, got {response.status_code}"
+        assert response.json()["detail"] == "Too many requests in progress, try again shortly", f"Unexpected detail '{response.json()['detail']}'"
+        
+        response = other_client.post("/api/admin/colors", json=payload)
+        assert response.status_code == 403, f"Expected other clients to be admitted, got {response.status_code}"
+        
+        asyncio.run(server.admission_store.release("admin:ip:198.51.100.1"))
+        response = busy_client.post("/api/admin/colors", json=payload)
+        assert response.status_code == 403, f"Expected the refused request's token to be returned, got {response.status_code}"
+    finally:
+        server.ADMISSION_LIMITS["admin"].update(original_limits)
+    
+    return True
+
+@run_test("Admission Control - Client IP Behind Trusted Proxies")
+def test_admission_trusted_proxies():
+    """Test that X-Forwarded-For is honored only from trusted proxies and only up to the first untrusted hop"""
+    import ipaddress
+    server = load_server()
+    original_limits = dict(server.ADMISSION_LIMITS["admin"])
+    original_proxies = server.TRUSTED_PROXIES
+    payload = {"password": "wrong_password", "action": "remove", "color_id": "t1_red"}
+    limits = {"max_concurrent": 2, "max_concurrent_per_client": 1, "rate_per_minute": 6, "burst": 1}
+    
+    def post(client, forwarded_for):
+        return client.post("/api/admin/colors", json=payload, headers={"X-Forwarded-For": forwarded_for}).status_code
+    
+    try:
+        server.TRUSTED_PROXIES = [ipaddress.ip_network("10.0.0.0/8")]
+        
+        # Untrusted peer: spoofed headers all share the peer's bucket
+        client = admin_test_client(server, limits, peer="198.51.100.1")
+        statuses = [post(client, "203.0.113.1"), post(client, "203.0.113.2")]
+        assert statuses == [403, 429], f"Expected spoofed X-Forwarded-For to be ignored, got {statuses}"
+        
+        # Trusted proxy: each forwarded client gets its own bucket
+        client = admin_test_client(server, limits, peer="10.0.0.5")
+        statuses = [post(client, "203.0.113.7, 10.0.0.9"), post(client, "203.0.113.8"), post(client, "203.0.113.7")]
+        assert statuses == [403, 403, 429], f"Expected per-client buckets behind the proxy, got {statuses}"
+        
+        # A spoofed leftmost hop does not escape the real client's bucket
+        statuses = [post(client, "192.0.2.50, 203.0.113.7")]
+        assert statuses == [429], f"Expected spoofed leftmost hop to be ignored, got {statuses}"
+    finally:
+        server.ADMISSION_LIMITS["admin"].update(original_limits)
+        server.TRUSTED_PROXIES = original_proxies
+    
+    return True
+
+@run_test("Admission Control - Invalid Limits Rejected")
+def test_admission_invalid_limits():
+    """Test that zero or negative limits are rejected when the config is loaded"""
+    server = load_server()
+    for name, value in [("RATE_PER_MINUTE", "0"), ("BURST", "0"), ("MAX_CONCURRENT", "-1"), ("MAX_CONCURRENT_PER_CLIENT", "0")]:
+        os.environ[f"TESTROUTE_{name}"] = value
+        try:
+            server.load_admission_limits("TESTROUTE", max_concurrent=1, max_concurrent_per_client=1, rate_per_minute=1, burst=1)
+            assert False, f"Expected TESTROUTE_{name}={value} to be rejected"
+        except ValueError:
+            pass
+        finally:
+            del os.environ[f"TESTROUTE_{name}"]
+    
+    limits = server.load_admission_limits("TESTROUTE", max_concurrent=2, max_concurrent_per_client=1, rate_per_minute=5, burst=3)
+    assert limits == {"max_concurrent": 2, "max_concurrent_per_client": 1, "rate_per_minute": 5.0, "burst": 3}, f"Unexpected limits {limits}"
+    
+    return True
+
+@run_test("Admission Control - Idle Rate Buckets Are Evicted")
+def test_admission_bucket_eviction():
+    """Test that buckets untouched for burst / rate seconds are dropped"""
+    server = load_server()
+    store = server.InMemoryAdmissionStore()
+    asyncio.run(store.take_token("orders:ip:1.2.3.4", 1, 2))
+    assert len(store.buckets) == 1, f"Expected 1 bucket, got {len(store.buckets)}"
+    
+    store.evict_idle_buckets(time.monotonic() + store.SWEEP_SECONDS + 3)
+    assert store.buckets == {}, f"Expected idle bucket to be evicted, got {store.buckets}"
+    
+    return True
+
 def print_summary():
     """Print a summary of test results"""
     print("\n" + "="*80)
@@ -386,6 +761,19 @@ if __name__ == "__main__":
     test_admin_update_color_valid_password()
     test_create_order()
     test_download_pdf()
+    test_catalog_snapshot_round_trip()
+    test_catalog_fallback_when_mongo_down()
+    test_catalog_unavailable_without_snapshot()
+    test_catalog_slow_mongo()
+    test_catalog_fresh_cache()
+    test_catalog_startup_and_seed_retry()
+    test_catalog_refresh_after_admin_change()
+    test_admission_rate_limit()
+    test_admission_concurrency_limit()
+    test_admission_per_client_limit()
+    test_admission_trusted_proxies()
+    test_admission_invalid_limits()
+    test_admission_bucket_eviction()
     
     # Print summary
     print_summary()
\ No newline at end of file